@@ -0,0 +1,908 @@
+// Riferimenti DOM risolti una sola volta al caricamento
+const $ = id => document.getElementById(id);
+const els = {
+    modeSelector: $('modeSelector'),
+    container: $('container'),
+    header: $('header'),
+    currentMode: $('currentMode'),
+    banOverlay: $('banOverlay'),
+    banTimer: $('banTimer'),
+    reportModal: $('reportModal'),
+    confirmModal: $('confirmModal'),
+    confirmText: $('confirmText'),
+    confirmOk: $('confirmOk'),
+    confirmCancel: $('confirmCancel'),
+    reportReason: $('reportReason'),
+    reportComment: $('reportComment'),
+    onlineCount: $('onlineCount'),
+    waitingCount: $('waitingCount'),
+    themeIcon: $('themeIcon'),
+    statusText: $('statusText'),
+    statusIndicator: $('statusIndicator'),
+    startBtn: $('startBtn'),
+    stopBtn: $('stopBtn'),
+    nextBtn: $('nextBtn'),
+    reportBtn: $('reportBtn'),
+    messageInput: $('messageInput'),
+    sendBtn: $('sendBtn'),
+    messages: $('messages'),
+    msgSentinel: $('msgSentinel'),
+    typingIndicator: $('typingIndicator'),
+    videoContainer: $('videoContainer'),
+    localVideo: $('localVideo'),
+    remoteVideo: $('remoteVideo'),
+    toggleVideoBtn: $('toggleVideoBtn'),
+    toggleAudioBtn: $('toggleAudioBtn'),
+    soundToggle: $('soundToggle'),
+    timestampToggle: $('timestampToggle'),
+    connectionStatus: $('connectionStatus')
+};
+
+let socket;
+let isConnected = false;
+let isSearching = false;
+let isTyping = false;
+let typingTimeout;
+let typingScheduled = false;
+let reconnectAttempts = 0;
+const MAX_RECONNECT_ATTEMPTS = 5;
+let currentPartnerId = null;
+let isBanned = false;
+let banEnd = null;
+let banRaf = null;
+let lastBanTick = 0;
+let lastBanText = '';
+let lastOnline = -1;
+let lastWaiting = -1;
+let chatMode = null;
+
+let localStream = null;
+let peerConnection = null;
+let isVideoEnabled = true;
+let isAudioEnabled = true;
+
+const ICE_SERVERS = {
+    iceServers: [
+        { urls: 'stun:stun.l.google.com:19302' },
+        { urls: 'stun:stun1.l.google.com:19302' }
+    ]
+};
+
+function selectMode(mode) {
+    chatMode = mode;
+    els.modeSelector.classList.toggle('is-active', false);
+    els.container.classList.toggle('is-active', true);
+    els.currentMode.textContent = mode === 'video' ? '📹 Video + Testo' : '💬 Solo Testo';
+
+    if (mode === 'video') {
+        initializeMedia();
+    }
+
+    checkBanStatus();
+}
+
+async function changeMode() {
+    if (isConnected || isSearching) {
+        if (!(await showConfirm('Sei sicuro di voler cambiare modalità? La chat corrente verrà terminata.'))) {
+            return;
+        }
+        if (isConnected) {
+            nextChat();
+        } else if (isSearching) {
+            stopChat();
+        }
+    }
+
+    if (socket && socket.connected && !isBanned) {
+        socket.emit('change_mode');
+        socket.disconnect();
+    }
+
+    if (localStream) {
+        localStream.getTracks().forEach(track => track.stop());
+        localStream = null;
+    }
+
+    const pc = peerConnection;
+    peerConnection = null;
+
+    chatMode = null;
+    els.container.classList.toggle('is-active', false);
+    els.modeSelector.classList.toggle('is-active', true);
+
+    // Il resto della pulizia non è visibile: lo rimandiamo a quando il browser è libero
+    runWhenIdle(() => {
+        if (pc) pc.close();
+        if (chatMode !== null) return;
+        els.videoContainer.classList.remove('active');
+        els.messages.replaceChildren(els.msgSentinel);
+    });
+}
+
+function runWhenIdle(callback) {
+    if ('requestIdleCallback' in window) {
+        requestIdleCallback(callback, { timeout: 500 });
+    } else {
+        setTimeout(callback, 0);
+    }
+}
+
+async function initializeMedia() {
+    try {
+        localStream = await navigator.mediaDevices.getUserMedia({
+            video: true,
+            audio: true
+        });
+
+        els.localVideo.srcObject = localStream;
+        els.videoContainer.classList.add('active');
+        addSystemMessage('✅ Camera e microfono attivati');
+    } catch (error) {
+        console.error('Errore accesso media:', error);
+        addSystemMessage('❌ Impossibile accedere a camera/microfono. Assicurati di aver dato i permessi.');
+        chatMode = 'text';
+        els.currentMode.textContent = '💬 Solo Testo (fallback)';
+    }
+}
+
+function toggleVideo() {
+    if (!localStream) return;
+
+    isVideoEnabled = !isVideoEnabled;
+    localStream.getVideoTracks().forEach(track => {
+        track.enabled = isVideoEnabled;
+    });
+
+    els.toggleVideoBtn.classList.toggle('off', !isVideoEnabled);
+}
+
+function toggleAudio() {
+    if (!localStream) return;
+
+    isAudioEnabled = !isAudioEnabled;
+    localStream.getAudioTracks().forEach(track => {
+        track.enabled = isAudioEnabled;
+    });
+
+    els.toggleAudioBtn.classList.toggle('off', !isAudioEnabled);
+}
+
+async function createPeerConnection() {
+    peerConnection = new RTCPeerConnection(ICE_SERVERS);
+
+    if (localStream) {
+        localStream.getTracks().forEach(track => {
+            peerConnection.addTrack(track, localStream);
+        });
+    }
+
+    peerConnection.ontrack = (event) => {
+        // ontrack scatta per ogni traccia (audio e video) dello stesso stream
+        const rv = els.remoteVideo;
+        if (rv.srcObject !== event.streams[0]) {
+            rv.preload = 'auto';
+            rv.srcObject = event.streams[0];
+        }
+    };
+
+    peerConnection.onicecandidate = (event) => {
+        if (event.candidate) {
+            socket.emit('ice_candidate', {
+                candidate: event.candidate
+            });
+        }
+    };
+
+    peerConnection.onconnectionstatechange = () => {
+        console.log('Connection state:', peerConnection.connectionState);
+        if (peerConnection.connectionState === 'disconnected' || 
+            peerConnection.connectionState === 'failed') {
+            addSystemMessage('⚠️ Connessione video persa');
+        }
+    };
+}
+
+async function createOffer() {
+    await createPeerConnection();
+    const offer = await peerConnection.createOffer();
+    await peerConnection.setLocalDescription(offer);
+    socket.emit('video_offer', { offer: offer });
+}
+
+async function handleOffer(offer) {
+    await createPeerConnection();
+    await peerConnection.setRemoteDescription(new RTCSessionDescription(offer));
+    const answer = await peerConnection.createAnswer();
+    await peerConnection.setLocalDescription(answer);
+    socket.emit('video_answer', { answer: answer });
+}
+
+async function handleAnswer(answer) {
+    await peerConnection.setRemoteDescription(new RTCSessionDescription(answer));
+}
+
+async function handleIceCandidate(candidate) {
+    if (peerConnection) {
+        await peerConnection.addIceCandidate(new RTCIceCandidate(candidate));
+    }
+}
+
+async function checkBanStatus() {
+    try {
+        const response = await fetch('/check_ban');
+        const data = await response.json();
+        if (data.banned) {
+            isBanned = true;
+            showBanOverlay(data.reason, data.ban_end);
+            disableInterface();
+        } else {
+            hideBanOverlay();
+            enableInterface();
+            initSocket();
+        }
+    } catch (error) {
+        console.error('Errore verifica ban:', error);
+        initSocket();
+    }
+}
+
+function initSocket() {
+    // Gli script defer girano in ordine di documento: se io manca il CDN non ha risposto
+    if (typeof io === 'undefined') {
+        console.error('Errore caricamento Socket.IO');
+        updateStatus('Impossibile connettersi al server', false);
+        return;
+    }
+
+    if (socket) socket.off();
+
+    socket = io({
+        reconnection: false,
+        reconnectionDelay: 1000,
+        reconnectionDelayMax: 5000,
+        reconnectionAttempts: MAX_RECONNECT_ATTEMPTS
+    });
+
+    setupSocketListeners();
+}
+
+function onConnect() {
+    console.log('✅ Connesso al server');
+    reconnectAttempts = 0;
+    isBanned = false;
+    showConnectionStatus('Connesso al server', true);
+    updateStatus('Connesso al server', false);
+    hideBanOverlay();
+    enableInterface();
+    socket.emit('get_stats');
+}
+
+function onDisconnect() {
+    console.log('❌ Disconnesso dal server');
+    isConnected = false;
+    isSearching = false;
+    showConnectionStatus('Disconnesso dal server', false);
+    updateStatus('Disconnesso', false);
+    disableChat();
+}
+
+function onConnectError(error) {
+    console.error('Errore connessione:', error);
+    reconnectAttempts++;
+    if (reconnectAttempts >= MAX_RECONNECT_ATTEMPTS) {
+        showConnectionStatus('Impossibile connettersi al server', false);
+    }
+}
+
+function onBanned(data) {
+    console.log('🚫 Utente bannato:', data);
+    isBanned = true;
+    showBanOverlay(data.reason, data.ban_end);
+    disableInterface();
+    socket.disconnect();
+}
+
+function onForceDisconnect(data) {
+    console.log('🚫 Disconnessione forzata (ban)');
+    isBanned = true;
+    showBanOverlay(data.reason, data.ban_end);
+    disableInterface();
+    socket.disconnect();
+}
+
+function onStatsUpdate(data) {
+    console.log('📊 Stats:', data);
+    const online = data.online | 0;
+    const waiting = data.waiting | 0;
+    if (online !== lastOnline) {
+        els.onlineCount.textContent = online;
+        lastOnline = online;
+    }
+    if (waiting !== lastWaiting) {
+        els.waitingCount.textContent = waiting;
+        lastWaiting = waiting;
+    }
+}
+
+function onWaiting() {
+    if (isBanned) return;
+    console.log('⏳ In attesa di un partner...');
+    isSearching = true;
+    updateStatus('Cercando un partner compatibile...', false, true);
+    addSystemMessage('🔍 Ricerca di un partner in corso... (modalità: ' + (chatMode === 'video' ? 'video' : 'testo') + ')');
+    els.stopBtn.style.display = 'inline-block';
+    els.startBtn.style.display = 'none';
+}
+
+async function onMatched(data) {
+    if (isBanned) return;
+    console.log('✅ Match trovato!', data);
+    isConnected = true;
+    isSearching = false;
+    currentPartnerId = data.partner_id;
+    updateStatus('Connesso con Stranger', true);
+    addSystemMessage('✅ Connesso con Stranger! Inizia a chattare!');
+    enableChat();
+    els.reportBtn.style.display = 'inline-block';
+    playSound('connect');
+
+    els.stopBtn.style.display = 'none';
+    els.startBtn.style.display = 'none';
+
+    if (chatMode === 'video' && data.initiator) {
+        await createOffer();
+    }
+}
+
+async function onVideoOffer(data) {
+    if (chatMode === 'video') {
+        await handleOffer(data.offer);
+    }
+}
+
+async function onVideoAnswer(data) {
+    if (chatMode === 'video') {
+        await handleAnswer(data.answer);
+    }
+}
+
+async function onIceCandidate(data) {
+    if (chatMode === 'video') {
+        await handleIceCandidate(data.candidate);
+    }
+}
+
+async function onIceCandidates(data) {
+    if (chatMode === 'video') {
+        const results = await Promise.allSettled(data.candidates.map(handleIceCandidate));
+        for (const result of results) {
+            if (result.status === 'rejected') console.error('Errore candidato ICE:', result.reason);
+        }
+    }
+}
+
+function onMessage(data) {
+    if (isBanned) return;
+    console.log('📨 Messaggio ricevuto:', data);
+    addMessage(data.message, 'received');
+    playSound('message');
+}
+
+function onPartnerDisconnected() {
+    if (isBanned) return;
+    console.log('👋 Partner disconnesso');
+    isConnected = false;
+    isSearching = false;
+    currentPartnerId = null;
+    updateStatus('Partner disconnesso', false);
+    addSystemMessage('❌ Il tuo partner si è disconnesso');
+    disableChat();
+    els.reportBtn.style.display = 'none';
+    playSound('disconnect');
+
+    if (peerConnection) {
+        peerConnection.close();
+        peerConnection = null;
+    }
+    els.remoteVideo.srcObject = null;
+
+    els.stopBtn.style.display = 'none';
+    els.startBtn.style.display = 'inline-block';
+}
+
+function onTyping() {
+    if (isBanned) return;
+    els.typingIndicator.classList.add('active');
+    scrollToBottom();
+}
+
+function onStopTyping() {
+    els.typingIndicator.classList.remove('active');
+}
+
+function onError(data) {
+    console.error('❌ Errore:', data.message);
+    addSystemMessage('❌ Errore: ' + data.message);
+}
+
+// Handler con nome: si possono staccare con socket.off() prima di riagganciarli
+const SOCKET_HANDLERS = {
+    connect: onConnect,
+    disconnect: onDisconnect,
+    connect_error: onConnectError,
+    banned: onBanned,
+    force_disconnect: onForceDisconnect,
+    stats_update: onStatsUpdate,
+    waiting: onWaiting,
+    matched: onMatched,
+    video_offer: onVideoOffer,
+    video_answer: onVideoAnswer,
+    ice_candidate: onIceCandidate,
+    ice_candidates: onIceCandidates,
+    message: onMessage,
+    partner_disconnected: onPartnerDisconnected,
+    typing: onTyping,
+    stop_typing: onStopTyping,
+    error: onError
+};
+
+function setupSocketListeners() {
+    for (const [event, handler] of Object.entries(SOCKET_HANDLERS)) {
+        socket.off(event, handler);
+        socket.on(event, handler);
+    }
+}
+
+function showBanOverlay(reason, banEndIso) {
+    const overlay = els.banOverlay;
+
+    banEnd = new Date(banEndIso);
+    stopBanTimer();
+    if (updateBanTimer()) {
+        startBanTimer();
+    }
+
+    if (!overlay.open) overlay.showModal();
+    disableInterface();
+}
+
+function hideBanOverlay() {
+    const overlay = els.banOverlay;
+    overlay.close();
+    stopBanTimer();
+    banEnd = null;
+    enableInterface();
+}
+
+// Countdown guidato da requestAnimationFrame: aggiorna al massimo una volta al secondo
+// e si ferma da solo quando la scheda non è visibile
+function banTick(ts) {
+    if (ts - lastBanTick >= 1000) {
+        lastBanTick = ts;
+        if (!updateBanTimer()) return;
+    }
+    banRaf = requestAnimationFrame(banTick);
+}
+
+function startBanTimer() {
+    if (banRaf === null && banEnd && !document.hidden) {
+        lastBanTick = performance.now();
+        banRaf = requestAnimationFrame(banTick);
+    }
+}
+
+function stopBanTimer() {
+    if (banRaf !== null) {
+        cancelAnimationFrame(banRaf);
+        banRaf = null;
+    }
+}
+
+document.addEventListener('visibilitychange', () => {
+    if (document.hidden) {
+        stopBanTimer();
+    } else if (banEnd && updateBanTimer()) {
+        startBanTimer();
+    }
+});
+
+function updateBanTimer() {
+    const diff = banEnd - Date.now();
+    if (diff <= 0) {
+        els.banTimer.textContent = '00:00';
+        lastBanText = '00:00';
+        isBanned = false;
+        hideBanOverlay();
+        addSystemMessage('✅ Ban terminato. Puoi tornare a chattare.');
+        checkBanStatus();
+        return false;
+    }
+
+    const minutes = Math.floor(diff / 60000);
+    const seconds = Math.floor((diff % 60000) / 1000);
+    const text = `${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`;
+    if (text !== lastBanText) {
+        els.banTimer.textContent = text;
+        lastBanText = text;
+    }
+    return true;
+}
+
+function openReportModal() {
+    if (isBanned || !currentPartnerId) return;
+    if (!els.reportModal.open) els.reportModal.showModal();
+    els.reportReason.value = '';
+    els.reportComment.value = '';
+}
+
+function closeReportModal() {
+    els.reportModal.close();
+}
+
+// Alternativa non bloccante a confirm(): socket e video continuano a girare
+let confirmResolve = null;
+
+function showConfirm(message) {
+    if (confirmResolve) confirmResolve(false);
+    els.confirmText.textContent = message;
+    if (!els.confirmModal.open) els.confirmModal.showModal();
+    return new Promise(resolve => {
+        confirmResolve = resolve;
+    });
+}
+
+function closeConfirm(result) {
+    if (confirmResolve) {
+        const resolve = confirmResolve;
+        confirmResolve = null;
+        resolve(result);
+    }
+    if (els.confirmModal.open) els.confirmModal.close();
+}
+
+els.confirmOk.addEventListener('click', () => closeConfirm(true));
+els.confirmCancel.addEventListener('click', () => closeConfirm(false));
+// ESC chiude il dialog: vale come "Annulla"
+els.confirmModal.addEventListener('close', () => closeConfirm(false));
+
+// Il ban non si chiude con ESC; se il browser lo chiude comunque lo riapriamo
+els.banOverlay.addEventListener('cancel', (e) => e.preventDefault());
+els.banOverlay.addEventListener('close', () => {
+    if (banEnd) els.banOverlay.showModal();
+});
+
+function submitReport() {
+    if (isBanned || !currentPartnerId) return;
+    const reason = els.reportReason.value;
+    const comment = els.reportComment.value.trim();
+
+    if (!reason) {
+        alert('Seleziona un motivo per la segnalazione');
+        return;
+    }
+
+    socket.emit('report_user', {
+        reported_id: currentPartnerId,
+        reason: reason,
+        comment: comment
+    });
+    closeReportModal();
+    addSystemMessage('✅ Segnalazione inviata');
+}
+
+function disableInterface() {
+    els.container.inert = true;
+    els.header.inert = true;
+    els.container.classList.add('is-dim');
+    els.header.classList.add('is-dim');
+    disableChat();
+}
+
+function enableInterface() {
+    els.container.inert = false;
+    els.header.inert = false;
+    els.container.classList.remove('is-dim');
+    els.header.classList.remove('is-dim');
+}
+
+function toggleTheme() {
+    if (isBanned) return;
+    const html = document.documentElement;
+    const icon = els.themeIcon;
+    const currentTheme = html.getAttribute('data-theme');
+
+    if (currentTheme === 'light') {
+        html.setAttribute('data-theme', 'dark');
+        icon.textContent = '☀️';
+    } else {
+        html.setAttribute('data-theme', 'light');
+        icon.textContent = '🌙';
+    }
+}
+
+const activeTags = new Set();
+const TAG_LABEL = new WeakMap();
+document.querySelectorAll('.interest-tags .tag').forEach(tag => {
+    TAG_LABEL.set(tag, tag.textContent.trim());
+});
+
+document.querySelector('.interest-tags').addEventListener('click', (e) => {
+    const tag = e.target.closest('.tag');
+    if (!tag || isBanned) return;
+    tag.classList.toggle('active');
+    activeTags.has(tag) ? activeTags.delete(tag) : activeTags.add(tag);
+});
+
+function getSelectedInterests() {
+    return [...activeTags].map(tag => TAG_LABEL.get(tag));
+}
+
+function startChat() {
+    if (!socket || !socket.connected || isBanned) {
+        if (isBanned) {
+            return;
+        } else {
+            addSystemMessage('❌ Connessione al server non disponibile. Riprova tra poco.');
+        }
+        return;
+    }
+
+    const interests = getSelectedInterests();
+
+    els.messages.replaceChildren(els.msgSentinel);
+
+    socket.emit('find_partner', { 
+        interests: interests,
+        chat_mode: chatMode
+    });
+
+    els.startBtn.disabled = true;
+}
+
+function stopChat() {
+    if (isSearching && !isBanned) {
+        socket.emit('stop_searching');
+        isSearching = false;
+        updateStatus('Connesso al server', false);
+        addSystemMessage('⏹️ Ricerca interrotta');
+
+        els.stopBtn.style.display = 'none';
+        els.startBtn.style.display = 'inline-block';
+        els.startBtn.disabled = false;
+    }
+}
+
+function nextChat() {
+    if (isBanned) return;
+    socket.emit('next_partner');
+    isConnected = false;
+    isSearching = false;
+    currentPartnerId = null;
+
+    els.messages.replaceChildren(els.msgSentinel);
+
+    disableChat();
+    els.reportBtn.style.display = 'none';
+
+    if (peerConnection) {
+        peerConnection.close();
+        peerConnection = null;
+    }
+    els.remoteVideo.srcObject = null;
+
+    els.stopBtn.style.display = 'none';
+    els.startBtn.style.display = 'inline-block';
+    els.startBtn.disabled = false;
+
+    updateStatus('Connesso al server', false);
+}
+
+function enableChat() {
+    if (isBanned) return;
+    els.messageInput.disabled = false;
+    els.sendBtn.disabled = false;
+    els.nextBtn.disabled = false;
+    els.messageInput.focus();
+}
+
+function disableChat() {
+    els.messageInput.disabled = true;
+    els.sendBtn.disabled = true;
+    els.nextBtn.disabled = true;
+    els.startBtn.disabled = isBanned;
+    els.reportBtn.style.display = 'none';
+}
+
+function sendMessage() {
+    if (isBanned || !isConnected) return;
+    const input = els.messageInput;
+    const message = input.value.trim();
+
+    if (message) {
+        socket.emit('send_message', { message: message });
+        addMessage(message, 'sent');
+        input.value = '';
+        playSound('send');
+        socket.emit('stop_typing');
+        isTyping = false;
+    }
+}
+
+function handleKeyPress(event) {
+    if (isBanned) return;
+    if (event.key === 'Enter' && !event.shiftKey) {
+        event.preventDefault();
+        sendMessage();
+    }
+}
+
+function handleTyping() {
+    if (typingScheduled) return;
+    typingScheduled = true;
+    requestAnimationFrame(() => {
+        typingScheduled = false;
+        if (!isConnected || isBanned) return;
+
+        const input = els.messageInput;
+        if (input.value.trim() === '') {
+            if (isTyping) {
+                isTyping = false;
+                socket.emit('stop_typing');
+            }
+            return;
+        }
+
+        if (!isTyping) {
+            isTyping = true;
+            socket.emit('typing');
+        }
+
+        clearTimeout(typingTimeout);
+        typingTimeout = setTimeout(() => {
+            isTyping = false;
+            socket.emit('stop_typing');
+        }, 1000);
+    });
+}
+
+function addMessage(text, type) {
+    if (isBanned) return;
+    const messages = els.messages;
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${type}`;
+
+    const showTimestamp = els.timestampToggle.checked;
+    const time = new Date().toLocaleTimeString('it-IT', { 
+        hour: '2-digit', 
+        minute: '2-digit' 
+    });
+
+    let content = '';
+    if (type === 'received') {
+        content += `<div class="message-sender">Stranger</div>`;
+    } else if (type === 'sent') {
+        content += `<div class="message-sender">Tu</div>`;
+    }
+    content += text;
+    if (showTimestamp && type !== 'system') {
+        content += `<div class="message-time">${time}</div>`;
+    }
+
+    messageDiv.innerHTML = content;
+    messages.insertBefore(messageDiv, els.msgSentinel);
+    scrollToBottom();
+}
+
+function addSystemMessage(text) {
+    const messages = els.messages;
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message system';
+    messageDiv.textContent = text;
+    messages.insertBefore(messageDiv, els.msgSentinel);
+    scrollToBottom();
+}
+
+function updateStatus(text, connected, searching = false, banned = false) {
+    els.statusText.textContent = text;
+    const indicator = els.statusIndicator;
+    indicator.classList.remove('connected', 'searching', 'banned');
+
+    if (banned) {
+        indicator.classList.add('banned');
+    } else if (connected) {
+        indicator.classList.add('connected');
+    } else if (searching) {
+        indicator.classList.add('searching');
+    }
+}
+
+function showConnectionStatus(text, isConnected) {
+    if (isBanned) return;
+    const status = els.connectionStatus;
+    const indicator = status.querySelector('.status-indicator');
+    const span = status.querySelector('span');
+
+    span.textContent = text;
+
+    if (isConnected) {
+        indicator.classList.add('connected');
+    } else {
+        indicator.classList.remove('connected');
+    }
+
+    status.classList.add('show');
+
+    setTimeout(() => {
+        status.classList.remove('show');
+    }, 3000);
+}
+
+function scrollToBottom() {
+    els.msgSentinel.scrollIntoView({ block: 'end' });
+}
+
+// Un solo AudioContext, creato al primo suono: i browser ne limitano il numero
+let audioContext = null;
+
+function getAudioContext() {
+    if (!audioContext) {
+        audioContext = new (window.AudioContext || window.webkitAudioContext)();
+    }
+    if (audioContext.state === 'suspended') {
+        audioContext.resume();
+    }
+    return audioContext;
+}
+
+function playTone(ctx, frequency, volume, duration, delay = 0) {
+    const start = ctx.currentTime + delay;
+    const oscillator = ctx.createOscillator();
+    const gainNode = ctx.createGain();
+
+    oscillator.connect(gainNode);
+    gainNode.connect(ctx.destination);
+
+    oscillator.frequency.value = frequency;
+    gainNode.gain.setValueAtTime(volume, start);
+    gainNode.gain.exponentialRampToValueAtTime(0.01, start + duration);
+    oscillator.start(start);
+    oscillator.stop(start + duration);
+}
+
+function playSound(type) {
+    if (!els.soundToggle.checked || isBanned) return;
+
+    try {
+        const ctx = getAudioContext();
+
+        switch(type) {
+            case 'message':
+                playTone(ctx, 800, 0.1, 0.1);
+                break;
+            case 'send':
+                playTone(ctx, 600, 0.05, 0.08);
+                break;
+            case 'connect':
+                playTone(ctx, 800, 0.1, 0.1);
+                playTone(ctx, 1000, 0.1, 0.1, 0.1);
+                break;
+            case 'disconnect':
+                playTone(ctx, 400, 0.1, 0.2);
+                break;
+        }
+    } catch (e) {
+        console.warn('Audio non disponibile:', e);
+    }
+}
+
+window.addEventListener('beforeunload', () => {
+    if (socket && socket.connected && !isBanned) {
+        socket.disconnect();
+    }
+    if (localStream) {
+        localStream.getTracks().forEach(track => track.stop());
+    }
+    if (peerConnection) {
+        peerConnection.close();
+    }
+});